@@ -1,10 +1,10 @@
 from __future__ import annotations
 
+from os import scandir
+from pathlib import Path
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
-    from pathlib import Path
-
     from viesco import Patcher
 
 
@@ -15,16 +15,22 @@ def validate(patcher: Patcher):
 
 def patch(patcher: Patcher):
     locales: dict[str, Path] = {}
-    locales_paths = tuple((patcher.install_path / "locales").glob("*.pak"))
+    locales_paths: list[Path] = []
 
-    for pak_path in locales_paths:
-        locale_name = pak_path.stem.lower()
-        locales[locale_name] = pak_path
+    with scandir(patcher.install_path / "locales") as entries:
+        for entry in entries:
+            if not entry.name.endswith(".pak") or not entry.is_file(follow_symlinks=False):
+                continue
+
+            pak_path = Path(entry.path)
+            locales_paths.append(pak_path)
+            locales[entry.name[:-4].lower()] = pak_path
 
     preserved: list[Path] = patcher.select_from(locales, prompt="Locales to preserve")
     patcher.output.comment(f"Preserved locales: {','.join(path.stem for path in preserved)}")
 
+    preserved_set = set(preserved)
     for pak_path in locales_paths:
-        if pak_path in preserved:
+        if pak_path in preserved_set:
             continue
         patcher.remove(pak_path)
@@ -1,25 +1,66 @@
 from __future__ import annotations
 
 import json
-from argparse import ArgumentParser
+import os
+import re
+from functools import cache
 from importlib import import_module
 from math import ceil
 from pathlib import Path
 from platform import system as get_system_name
 from sys import stderr, stdout
-from typing import Any, Callable
+from typing import TYPE_CHECKING, Any, Callable, ClassVar, TextIO
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from types import ModuleType
+
+_SELECTION_SEP_RE = re.compile(r"\s*,\s*")
+
+
+def _load_json(path: Path) -> Any:
+    data = path.read_bytes()
+
+    # orjson parses faster, but importing it costs more than that saves below a few MiB
+    if len(data) > 2 * 1024 * 1024:
+        try:
+            from orjson import loads  # noqa: PLC0415
+        except ImportError:
+            pass
+        else:
+            return loads(data)
+
+    return json.loads(data)
+
+
+@cache
+def _parse_version(version: str) -> tuple[int, int, int]:
+    # Missing components count as zeros, so 1.102 and 1.102.0 compare as equal
+    major, _, rest = version.partition(".")
+    minor, _, patch = rest.partition(".")
+    return (int(major), int(minor or 0), int(patch or 0))
 
 
 class ScriptWriter:
-    def __init__(self, patcher: Patcher, patches: list[tuple[str, Any]], output_path: str | None):
+    # Characters that cmd.exe would otherwise expand or treat as operators
+    _BATCH_ESCAPE: ClassVar[dict[int, str]] = str.maketrans({
+        "%": "%%",
+        "^": "^^",
+        "&": "^&",
+        "|": "^|",
+        "<": "^<",
+        ">": "^>",
+    })
+
+    def __init__(self, patcher: Patcher, output_path: str | None):
         self.patcher = patcher
         patcher.output = self
 
         self.platform = ""
-        self.lines = []
+        self.lines: list[bytes] = []
+        self._append = self.lines.append
 
         if not output_path:
-            self._prepare = self._dummy
             self.comment = self._dummy
             self.set_variable = self._dummy
             self.remove_file = self._dummy
@@ -28,7 +69,7 @@ class ScriptWriter:
         self.output_path = Path(output_path)
         if self.output_path.suffix in {".bat", ".cmd"}:
             self.platform = "Windows"
-            self._prepare = self._batch_prepare
+            self._header = self._batch_header
             self.comment = self._batch_comment
             self.set_variable = self._batch_set_variable
             self.remove_file = self._batch_remove_file
@@ -36,13 +77,22 @@ class ScriptWriter:
             msg = f"Unsupported output file extension {self.output_path.suffix}."
             raise ValueError(msg)
 
-        self._prepare()
-        self.comment(
+    def write(self, patch_names: list[str]):
+        if not self.platform:
+            return
+
+        with self.output_path.open("wb") as f:
+            f.writelines(self._header(patch_names))
+            f.writelines(self.lines)
+
+    def _header_comment(self, patch_names: list[str]) -> tuple[str, ...]:
+        patcher = self.patcher
+        return (
             f"This script was created AUTOMATICALLY using Viesco v{Patcher.VERSION}",
             f"for {patcher.host_product} v{patcher.host_version} on {patcher.host_platform}.",
             "",
             "Applied patches:",
-            f"  {','.join(name for name, _ in patches)}",
+            f"  {','.join(patch_names)}",
             "",
             "GitHub: https://github.com/noahrenes/viesco",
             "Codeberg: https://codeberg.org/renesnoah/viesco",
@@ -56,39 +106,56 @@ class ScriptWriter:
             "warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR ",
             "PURPOSE.",
         )
-        self.set_variable("VSC_PATH", patcher.install_path)
-
-    def write(self):
-        if self.lines:
-            self.output_path.write_text("\n".join(self.lines))
 
     def _dummy(self, *_, **__):
         pass
 
-    def _batch_prepare(self):
-        self.lines.append("@echo off")
+    def _batch_header(self, patch_names: list[str]) -> list[bytes]:
+        return [
+            b"@echo off\r\n",
+            self._batch_format_comment(*self._header_comment(patch_names)),
+            self._batch_format_variable("VSC_PATH", self.patcher.install_path),
+        ]
+
+    def _batch_format_comment(self, *lines: str) -> bytes:
+        return "".join([f"rem {line}\r\n" for line in lines]).encode()
+
+    def _batch_format_variable(self, name: str, value: Any) -> bytes:
+        return f'set "{name}={value}"\r\n'.encode()
 
     def _batch_comment(self, *lines: str):
-        self.lines.extend(f"rem {line}" for line in lines)
+        self._append(self._batch_format_comment(*lines))
 
     def _batch_set_variable(self, name: str, value: Any):
-        self.lines.append(f'set "{name}={value}"')
+        self._append(self._batch_format_variable(name, value))
 
     def _batch_remove_file(self, path: Path):
-        if self.patcher.install_path in path.parents:
-            path = Path("%VSC_PATH%") / path.relative_to(self.patcher.install_path)
+        path_str = str(path)
+        install_prefix = self.patcher.install_prefix
+        if path_str.startswith(install_prefix):
+            # Batch scripts always run on Windows, whatever the host separator is
+            rel_path = path_str[len(install_prefix) :].replace(os.sep, "\\")
+            path_str = "%VSC_PATH%\\" + rel_path.translate(self._BATCH_ESCAPE)
 
-        self.lines.append(f"echo :: Deleting {path}...")
-        self.lines.append(f"del /F /Q {path}")
+        path_bytes = path_str.encode()
+        self._append(b"echo :: Deleting %s...\r\ndel /F /Q %s\r\n" % (path_bytes, path_bytes))
 
 
 class Patcher:
     VERSION = "1.0.0"
 
+    _LEVELS: ClassVar[dict[str, tuple[str, TextIO]]] = {
+        "warning": ("[!]", stderr),
+        "error": ("[!]", stderr),
+        "debug": ("..", stderr),
+        "info": ("[+]", stdout),
+    }
+
     def __init__(self, *, dry_run: bool = False):
         self.dry_run = dry_run
         self.output: ScriptWriter = None
         self.install_path: Path = None
+        self.install_prefix: str = None
 
         self._skip_patch = False
         self._current_patch = ""
@@ -99,6 +166,7 @@ class Patcher:
         self.host_platform = get_system_name()
         self.host_product = ""
         self.host_version = ""
+        self._host_version_info: tuple[int, int, int] | None = None
 
     def _ask_to_skip_patch(self, *args):
         self.print(*args, level="warning")
@@ -113,18 +181,21 @@ class Patcher:
         product_path = install_path / "resources/app/product.json"
         package_path = install_path / "resources/app/package.json"
 
-        if not product_path.is_file() or not package_path.is_file():
+        try:
+            self._product_info = _load_json(product_path)
+            self._package_info = _load_json(package_path)
+        except OSError:
             return False
 
-        with product_path.open() as f:
-            self._product_info = json.load(f)
-        with package_path.open() as f:
-            self._package_info = json.load(f)
-
         self.host_product = self._product_info["nameShort"]
         self.host_version = self._package_info["version"]
+        try:
+            self._host_version_info = _parse_version(self.host_version)
+        except ValueError:
+            self._host_version_info = None
 
         self.install_path = install_path
+        self.install_prefix = f"{os.fspath(install_path)}{os.sep}"
         return True
 
     def validate_patch(self, name: str, validator: Callable[[Patcher], None]) -> bool:
@@ -132,18 +203,38 @@ class Patcher:
         validator(self)
         return not self._skip_patch
 
+    def _import_patch(self, name: str) -> ModuleType | None:
+        module_name = f"patches.{name}"
+        try:
+            patch_module = import_module(module_name)
+        except ModuleNotFoundError as exc:
+            if module_name != exc.name and not module_name.startswith(f"{exc.name}."):
+                raise
+            self.print(f"Patch 'patches/{name}.py' not found. Skipping...", level="warning")
+            return None
+
+        return patch_module
+
+    def import_patches(self, names: Iterable[str]) -> list[tuple[str, ModuleType]]:
+        modules = [(name, self._import_patch(name)) for name in names]
+        return [(name, module) for name, module in modules if module is not None]
+
+    def validate_patches(
+        self, modules: Iterable[tuple[str, ModuleType]]
+    ) -> list[tuple[str, Callable[[Patcher], None]]]:
+        return [
+            (name, patch_module.patch)
+            for name, patch_module in modules
+            if self.validate_patch(name, patch_module.validate)
+        ]
+
     def check_product_name(self, *supported: str):
         if self.host_product not in supported:
             self._ask_to_skip_patch(f"'{self.host_product}' is not supported by the patch.")
 
     def check_version(self, minimal_str: str):
-        minimal = tuple(map(int, minimal_str.split(".")))
-        current: tuple[int, ...] = tuple(map(int, self.host_version.split(".")))
-        if not (
-            current[0] >= minimal[0]
-            and (len(minimal) < 2 or current[1] >= minimal[1])
-            and (len(minimal) < 3 or current[2] >= minimal[2])
-        ):
+        current = self._host_version_info
+        if current is None or current < _parse_version(minimal_str):
             self._ask_to_skip_patch(
                 f"{self.host_product} v{self.host_version}",
                 f"is not supported by the patch (minimal: v{minimal_str}).",
@@ -163,24 +254,21 @@ class Patcher:
             except KeyboardInterrupt:
                 exit(1)
 
+            selected = selected.strip()
+            if not selected:
+                continue
+
             invalid = []
-            selected = selected.split(",")
+            selected = _SELECTION_SEP_RE.split(selected)
             for sel_idx, sel_item in enumerate(selected):
-                try:
-                    label_idx = labels.index(sel_item)
-                except ValueError:
-                    label_idx = -1
-
-                if label_idx < 0:
-                    try:
-                        label_idx = int(sel_item) - 1
-                    except ValueError:
-                        invalid.append(sel_item)
-                        continue
-
-                    if label_idx < 0 or max_items_idx < label_idx:
-                        invalid.append(sel_item)
-                        continue
+                if sel_item in items:
+                    selected[sel_idx] = items[sel_item]
+                    continue
+
+                label_idx = int(sel_item) - 1 if sel_item.isdecimal() else -1
+                if label_idx < 0 or max_items_idx < label_idx:
+                    invalid.append(sel_item)
+                    continue
 
                 selected[sel_idx] = values[label_idx]
 
@@ -197,31 +285,33 @@ class Patcher:
         columns_n = round(items_len**0.4)  # 0.4 results in a more square-ish output
         rows_n = ceil(items_len / columns_n)
 
-        rows: list[list[tuple[str, str]]] = []
-        label_max_lengths = [0] * columns_n
-        prefix_max_lengths = [0] * columns_n
-
-        for offset in range(rows_n):
-            rows.append([])
-
-            for item_idx in range(offset, items_len, rows_n):
-                item = (str(item_idx + 1), str(items[item_idx]))
-                rows[-1].append(item)
-
-                col = item_idx // rows_n
-                prefix_max_lengths[col] = max(len(item[0]), prefix_max_lengths[col])
-                label_max_lengths[col] = max(len(item[1]), label_max_lengths[col])
-
-        for row in rows:
-            print(
-                "  ".join(
-                    (
-                        f"{item[0].rjust(prefix_max_lengths[col])}) "
-                        f"{item[1].ljust(label_max_lengths[col])}"
-                    )
-                    for col, item in enumerate(row)
-                ),
-            )
+        labels = [str(item) for item in items]
+
+        # Items are laid out column by column, so each column is a contiguous slice
+        # and its widest prefix is the number of its last item.
+        label_max_lengths = [
+            max(map(len, labels[col * rows_n : (col + 1) * rows_n]), default=0)
+            for col in range(columns_n)
+        ]
+        prefix_max_lengths = [
+            len(str(min((col + 1) * rows_n, items_len))) for col in range(columns_n)
+        ]
+
+        formats = [
+            f"{{:>{prefix_length}}}) {{:<{label_length}}}"
+            for prefix_length, label_length in zip(prefix_max_lengths, label_max_lengths)
+        ]
+
+        lines = [
+            "  ".join([
+                fmt.format(item_idx + 1, labels[item_idx])
+                for fmt, item_idx in zip(formats, range(offset, items_len, rows_n))
+            ])
+            for offset in range(rows_n)
+        ]
+        lines.append("")
+        stdout.write("\n".join(lines))
+        stdout.flush()
 
     def print_patch_name(self, name: str):
         self._current_patch = ""
@@ -233,40 +323,25 @@ class Patcher:
         sep = "-" * 70
         self.output.comment(sep, name, sep)
 
-    def print(self, *args, level: str = "", **kwargs):
-        fd = stdout
-        if level in {"warning", "error"}:
-            level = "[!]"
-            fd = stderr
-        elif level == "debug":
-            level = ".."
-            fd = stderr
-        elif level == "info":
-            level = "[+]"
-        else:
-            level = "::"
-
-        if self._current_patch:
-            print(f"[{self._current_patch}]", level, *args, file=fd, **kwargs)
-        else:
-            print(level, *args, file=fd, **kwargs)
+    def print(self, *args, level: str = "", sep: str = " ", end: str = "\n"):
+        level, fd = self._LEVELS.get(level, ("::", stdout))
+        prefix = (f"[{self._current_patch}]", level) if self._current_patch else (level,)
+        fd.write(f"{sep.join(map(str, prefix + args))}{end}")
 
     def remove(self, path_str: Path | str, platform: str = ""):
         path = Path(path_str)
-        if path.is_relative_to(self.install_path):
-            path_str = path.relative_to(self.install_path)
+        path_str = str(path).removeprefix(self.install_prefix)
 
+        output = self.output
         is_targeting_host = not self.dry_run and (not platform or platform == self.host_platform)
-        is_targeting_output = self.output.lines and (
-            not platform or platform == self.output.platform
-        )
+        is_targeting_output = output.platform and (not platform or platform == output.platform)
 
         if is_targeting_host:
             path.unlink(missing_ok=True)
             self.print(f"Removed {path_str}.", level="info")
 
         if is_targeting_output:
-            self.output.remove_file(path)
+            output.remove_file(path)
             if not is_targeting_host:
                 self.print(f"The script will remove {path_str}.", level="info")
         elif not is_targeting_host:
@@ -274,12 +349,19 @@ class Patcher:
                 f"Ignored {path_str}.",
                 f"(expected: {platform or '<any>'},",
                 f"host: {self.host_platform or '<unknown>'},",
-                f"target: {self.output.platform or '<none>'})",
+                f"target: {output.platform or '<none>'})",
                 level="debug",
             )
 
 
 if __name__ == "__main__":
+    from argparse import ArgumentParser
+    from contextlib import suppress
+
+    # Gives input() prompts line editing and history where the platform supports it
+    with suppress(ImportError):
+        import readline  # noqa: F401
+
     parser = ArgumentParser(
         prog="viesco",
         description="An utility for configuring VSCodium before first run.",
@@ -313,27 +395,19 @@ if __name__ == "__main__":
         patcher.print(f"'{args.install}' is not a valid path to VSCodium.", level="warning")
         exit(1)
 
-    patches: list[tuple[str, Callable[[Patcher], None]]] = []
-    for patch_name in args.patch:
-        if not Path(f"patches/{patch_name}.py").is_file():
-            patcher.print(
-                f"Patch 'patches/{patch_name}.py' not found. Skipping...", level="warning"
-            )
-            continue
-
-        patch_module = import_module(f"patches.{patch_name}")
-        if patcher.validate_patch(patch_name, patch_module.validate):
-            patches.append((patch_name, patch_module.patch))
-
     try:
-        ScriptWriter(patcher, patches, args.output)
+        ScriptWriter(patcher, args.output)
     except ValueError as exc:
         patcher.print(exc, level="warning")
         exit(1)
 
+    patches = patcher.validate_patches(patcher.import_patches(args.patch))
+
+    applied: list[str] = []
     for name, func in patches:
         patcher.print_patch_name(name)
         func(patcher)
+        applied.append(name)
 
-    if patches:
-        patcher.output.write()
+    if applied:
+        patcher.output.write(applied)